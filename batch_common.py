@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+"""
+批量处理公共模块
+auto_batch.py 与 auto_batch_v2.py 共用的日志、浏览器池和渲染/打包流水线
+"""
+
+import os
+import atexit
+import logging
+import logging.handlers
+import sys
+import json
+import queue
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from datetime import datetime
+
+# Selenium
+from selenium import webdriver
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.chrome.options import Options
+from selenium.common.exceptions import TimeoutException, WebDriverException
+
+# 导入服务器模块
+from server import start_server, wait_for_server, set_collection_folder, build_folder_info, state
+
+PROCESSOR_URL = "http://localhost:8765/batch-processor.html"
+DEFAULT_WORKERS = 3  # 并行浏览器数量
+
+LOG_ICONS = {"INFO": "ℹ️", "SUCCESS": "✅", "WARNING": "⚠️", "ERROR": "❌", "PROCESS": "⚙️"}
+
+class LogFormatter(logging.Formatter):
+    """带时间戳和图标的日志格式，raw 记录原样输出"""
+    def format(self, record):
+        if getattr(record, "raw", False):
+            return record.getMessage()
+        return super().format(record)
+
+# 日志经队列交给后台线程输出，工作线程不争抢 stdout
+logger = logging.getLogger("auto_batch")
+logger.setLevel(logging.INFO)
+logger.propagate = False
+_log_queue = queue.Queue()
+logger.addHandler(logging.handlers.QueueHandler(_log_queue))
+_console = logging.StreamHandler(sys.stdout)
+_console.setFormatter(LogFormatter("[%(asctime)s] %(icon)s %(message)s", datefmt="%H:%M:%S"))
+_log_listener = logging.handlers.QueueListener(_log_queue, _console)
+_log_listener.start()
+atexit.register(_log_listener.stop)
+
+def log(message, level="INFO"):
+    """打印日志"""
+    logger.info(message, extra={"icon": LOG_ICONS.get(level, "ℹ️")})
+
+def echo(message=""):
+    """原样输出一行（与日志保持顺序）"""
+    logger.info(message, extra={"raw": True})
+
+def setup_chrome(headless=True, download_dir=None):
+    """配置Chrome浏览器（指定 download_dir 时设置下载目录）"""
+    chrome_options = Options()
+    
+    # 基础配置
+    chrome_options.add_argument("--no-sandbox")
+    chrome_options.add_argument("--disable-dev-shm-usage")
+    chrome_options.add_argument("--disable-blink-features=AutomationControlled")
+    chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
+    chrome_options.add_experimental_option('useAutomationExtension', False)
+    
+    # 精简启动：关闭与渲染无关的组件（图片解码需保留，html2canvas 依赖它）
+    chrome_options.add_argument("--disable-gpu")
+    chrome_options.add_argument("--disable-extensions")
+    chrome_options.add_argument("--disable-background-networking")
+    chrome_options.add_argument("--disable-default-apps")
+    chrome_options.add_argument("--no-first-run")
+    chrome_options.add_argument("--disable-features=TranslateUI")
+    # DOM 可交互即返回，不等待全部子资源
+    chrome_options.page_load_strategy = 'eager'
+    
+    # 下载配置 - 设置下载目录
+    if download_dir is not None:
+        prefs = {
+            "download.default_directory": str(download_dir),
+            "download.prompt_for_download": False,
+            "download.directory_upgrade": True,
+            "safebrowsing.enabled": True
+        }
+        chrome_options.add_experimental_option("prefs", prefs)
+    
+    # 无头模式（不显示浏览器窗口）
+    if headless:
+        chrome_options.add_argument("--headless=new")
+    
+    driver = webdriver.Chrome(options=chrome_options)
+    driver.set_window_size(1400, 900)
+    driver.set_script_timeout(60)  # 单个文件夹处理的最长时间
+    return driver
+
+def open_processor(driver, timeout=10):
+    """打开批量处理器页面并等待脚本就绪"""
+    driver.get(PROCESSOR_URL)
+    WebDriverWait(driver, timeout).until(
+        lambda d: d.execute_script("return !!window.BatchProcessor")
+    )
+
+def create_driver(download_dir=None):
+    """启动浏览器并打开批量处理器页面"""
+    driver = setup_chrome(download_dir=download_dir)
+    open_processor(driver)
+    return driver
+
+def close_driver(driver):
+    """关闭浏览器，忽略已失效的会话"""
+    try:
+        driver.quit()
+    except WebDriverException:
+        pass
+
+def wait_for_drivers(driver_futures):
+    """等待预热的浏览器全部就绪；任一启动失败则关闭已启动的浏览器并抛出该异常"""
+    drivers, error = [], None
+    for future in driver_futures:
+        try:
+            drivers.append(future.result())
+        except Exception as e:
+            error = error or e
+    
+    if error is not None:
+        for driver in drivers:
+            close_driver(driver)
+        raise error
+    return drivers
+
+def ensure_driver(driver, download_dir=None):
+    """确认浏览器会话可用，失效时重新启动"""
+    try:
+        if driver.session_id and driver.execute_script("return !!window.BatchProcessor"):
+            return driver
+    except WebDriverException:
+        pass
+    
+    log("浏览器会话失效，重新启动...", "WARNING")
+    close_driver(driver)
+    return create_driver(download_dir)
+
+def load_folder(driver, index):
+    """通过CDP直接向页面注入文件夹数据（无需刷新页面或额外请求）"""
+    info = build_folder_info(state.all_folders[index]["path"])
+    response = driver.execute_cdp_cmd("Runtime.evaluate", {
+        "expression": f"window.BatchProcessor.ingest({json.dumps(info)})",
+        "awaitPromise": True,
+        "returnByValue": True
+    })
+    return response.get("result", {}).get("value", False)
+
+def run_processing(driver):
+    """触发浏览器端处理并在同一次调用中等待完成（超时由 script timeout 控制）"""
+    try:
+        return driver.execute_async_script(
+            "const done = arguments[arguments.length - 1];"
+            "window.BatchProcessor.process().then(name => done(name !== null), () => done(false));"
+        )
+    except TimeoutException:
+        return False
+
+def is_up_to_date(zip_path, source_dir):
+    """输出ZIP是否已存在且比源文件夹新"""
+    try:
+        return zip_path.stat().st_mtime > os.stat(source_dir).st_mtime
+    except FileNotFoundError:
+        return False
+
+def render_one(driver, index, folder_info, total):
+    """用指定浏览器渲染单个文件夹，失败时返回错误结果"""
+    folder_name = folder_info['name']
+    log(f"[{index+1}/{total}] 处理: {folder_name}", "PROCESS")
+    
+    # 只校验索引：数据经 CDP 按浏览器各自注入，多个工作线程不能改写服务器共享的“当前文件夹”
+    if not 0 <= index < len(state.all_folders):
+        log(f"设置文件夹失败: {folder_name}", "ERROR")
+        return {"folder": folder_name, "success": False, "error": "Invalid folder"}
+    
+    # 页面内加载新文件夹数据
+    if not load_folder(driver, index):
+        log(f"加载文件夹失败: {folder_name}", "ERROR")
+        return {"folder": folder_name, "success": False, "error": "Load failed"}
+    
+    # 调用JS处理函数并等待完成
+    log(f"开始渲染和截图: {folder_name}")
+    if not run_processing(driver):
+        log(f"浏览器处理失败或超时: {folder_name}", "WARNING")
+    
+    return None
+
+def run_collection(collection_path, collect, title, workers=DEFAULT_WORKERS, force=False, download_dir=None):
+    """启动服务器和浏览器池，渲染集合内所有文件夹并逐个追加进总包
+    
+    collect(folder_name, output_dir) 在浏览器渲染后取回该文件夹的ZIP并返回结果字典。
+    返回 (results, master_zip, output_dir)，启动失败时返回 None。
+    """
+    collection_path = Path(collection_path)
+    
+    if not collection_path.exists():
+        log(f"文件夹不存在: {collection_path}", "ERROR")
+        return None
+    
+    echo("\n" + "=" * 60)
+    echo(title)
+    echo("=" * 60 + "\n")
+    
+    # 1. 启动服务器
+    log("启动HTTP服务器...")
+    server = start_server(port=8765)
+    wait_for_server(port=8765)
+    
+    # 2. 后台并发预热浏览器池，同时扫描文件夹
+    log(f"启动 {workers} 个Chrome浏览器...")
+    launcher = ThreadPoolExecutor(max_workers=workers)
+    driver_futures = [launcher.submit(create_driver, download_dir) for _ in range(workers)]
+    launcher.shutdown(wait=False)
+    
+    log(f"扫描集合文件夹: {collection_path}")
+    folders = set_collection_folder(collection_path)
+    
+    if not folders:
+        log("未找到有效的子文件夹", "ERROR")
+        try:
+            for driver in wait_for_drivers(driver_futures):
+                close_driver(driver)
+        except Exception:
+            pass
+        server.shutdown()
+        return None
+    
+    log(f"找到 {len(folders)} 个待处理文件夹", "SUCCESS")
+    for i, f in enumerate(folders, 1):
+        echo(f"  {i}. {f['name']}")
+    
+    # 3. 等待浏览器池就绪
+    try:
+        ready = wait_for_drivers(driver_futures)
+    except Exception as e:
+        log(f"Chrome浏览器启动失败: {e}", "ERROR")
+        server.shutdown()
+        return None
+    
+    drivers = queue.Queue()
+    for driver in ready:
+        drivers.put(driver)
+    log(f"{workers} 个Chrome浏览器已就绪", "SUCCESS")
+    
+    # 4. 并行处理文件夹
+    output_dir = state.output_dir
+    output_dir.mkdir(parents=True, exist_ok=True)
+    
+    # 渲染与收尾流水线：浏览器渲染完立即归还，下载/打包交给后台线程
+    pack_q = queue.Queue()
+    
+    def worker(index, folder_info):
+        # 续跑模式：已有比源文件夹新的ZIP则跳过
+        zip_path = output_dir / f"{folder_info['name']}_表情包.zip"
+        if not force and is_up_to_date(zip_path, folder_info['path']):
+            log(f"已存在，跳过: {zip_path.name}")
+            skipped = {"folder": folder_info['name'], "success": True, "path": zip_path, "skipped": True}
+            pack_q.put((index, folder_info, skipped))
+            return
+        
+        driver = drivers.get()
+        try:
+            driver = ensure_driver(driver, download_dir)
+            error = render_one(driver, index, folder_info, len(folders))
+        except Exception as e:
+            log(f"处理出错 {folder_info['name']}: {e}", "ERROR")
+            error = {"folder": folder_info['name'], "success": False, "error": str(e)}
+        finally:
+            drivers.put(driver)
+        pack_q.put((index, folder_info, error))
+    
+    # 总包随子包完成逐个追加（子包已是压缩文件，直接存储避免重复压缩）
+    timestamp = datetime.now().strftime("%m%d_%H%M")
+    master_zip = output_dir / f"表情包合集_{timestamp}.zip"
+    master = zipfile.ZipFile(master_zip, 'w', zipfile.ZIP_STORED)
+    results_by_index = {}
+    
+    def packer():
+        while True:
+            item = pack_q.get()
+            if item is None:
+                break
+            index, folder_info, result = item
+            try:
+                if result is None:
+                    result = collect(folder_info['name'], output_dir)
+                if result.get("success"):
+                    master.write(result["path"], result["path"].name)
+            except Exception as e:
+                log(f"打包出错 {folder_info['name']}: {e}", "ERROR")
+                result = {"folder": folder_info['name'], "success": False, "error": str(e)}
+            results_by_index[index] = result
+    
+    packer_thread = threading.Thread(target=packer, daemon=True)
+    packer_thread.start()
+    executor = ThreadPoolExecutor(max_workers=workers)
+    
+    try:
+        futures = [
+            executor.submit(worker, index, folder_info)
+            for index, folder_info in enumerate(folders)
+        ]
+        for future in as_completed(futures):
+            future.result()
+    
+    except KeyboardInterrupt:
+        log("用户中断", "WARNING")
+    except Exception as e:
+        log(f"处理出错: {e}", "ERROR")
+        import traceback
+        traceback.print_exc()
+    
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+        pack_q.put(None)
+        packer_thread.join()
+        master.close()
+        
+        # 5. 清理
+        echo("\n" + "-" * 50)
+        log("关闭浏览器...")
+        while not drivers.empty():
+            close_driver(drivers.get_nowait())
+        
+        log("停止服务器...")
+        server.shutdown()
+    
+    results = [results_by_index[i] for i in sorted(results_by_index)]
+    
+    # 6. 总包收尾（无成功子包时删除空总包）
+    if not any(r.get("success") for r in results):
+        master_zip.unlink(missing_ok=True)
+    
+    return results, master_zip, output_dir
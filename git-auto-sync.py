@@ -11,23 +11,89 @@
 """
 
 import os
+import re
 import sys
 import json
 import time
-import hashlib
+import queue
+import fnmatch
+import argparse
+import importlib.util
 import subprocess
 from pathlib import Path
 from datetime import datetime
-from typing import Set, Dict, Optional
+from functools import cached_property
+from typing import Optional
+
+# 文件系统监听（可选，未安装时回退为每秒 git status 轮询）
+# 仅检测是否安装，在 _watch_events 内导入，--push 等单次命令不加载
+HAS_WATCHDOG = importlib.util.find_spec("watchdog") is not None
+
+# libgit2 绑定（可选，状态查询在进程内完成，不再每次 fork git）
+# 同样只检测，首次访问 GitAutoSync.repo 时才导入
+HAS_PYGIT2 = importlib.util.find_spec("pygit2") is not None
+
+# 轮询回退：空闲时检查间隔从 1 秒逐步翻倍到 8 秒
+POLL_MIN_INTERVAL = 1.0
+POLL_MAX_INTERVAL = 8.0
+
+
+def _porcelain_code(flags: int) -> str:
+    """把 libgit2 状态标志转换为 git status --porcelain 的两位状态码"""
+    import pygit2
+    index_flags = [
+        (pygit2.GIT_STATUS_INDEX_NEW, "A"),
+        (pygit2.GIT_STATUS_INDEX_MODIFIED, "M"),
+        (pygit2.GIT_STATUS_INDEX_DELETED, "D"),
+        (pygit2.GIT_STATUS_INDEX_RENAMED, "R"),
+        (pygit2.GIT_STATUS_INDEX_TYPECHANGE, "T"),
+    ]
+    wt_flags = [
+        (pygit2.GIT_STATUS_WT_MODIFIED, "M"),
+        (pygit2.GIT_STATUS_WT_DELETED, "D"),
+        (pygit2.GIT_STATUS_WT_RENAMED, "R"),
+        (pygit2.GIT_STATUS_WT_TYPECHANGE, "T"),
+    ]
+    x = next((code for flag, code in index_flags if flags & flag), " ")
+    y = next((code for flag, code in wt_flags if flags & flag), " ")
+    if flags & pygit2.GIT_STATUS_WT_NEW and x == " ":
+        return "??"
+    return x + y
 
 
 class GitAutoSync:
     def __init__(self, repo_path: str = "."):
         self.repo_path = Path(repo_path).resolve()
         self.config_file = self.repo_path / ".git-auto-sync.json"
-        self.config = self._load_config()
-        self.file_hashes: Dict[str, str] = {}
-        
+    
+    # 配置、忽略规则、pygit2 仓库都在首次使用时才加载，--push 等单次命令用不到
+    @cached_property
+    def config(self) -> dict:
+        return self._load_config()
+    
+    @cached_property
+    def repo(self):
+        """用 pygit2 打开仓库，失败时为 None（回退到 git 子进程）"""
+        if not HAS_PYGIT2:
+            return None
+        import pygit2
+        try:
+            return pygit2.Repository(str(self.repo_path))
+        except pygit2.GitError:
+            return None
+    
+    @cached_property
+    def _ignore_re(self) -> "re.Pattern":
+        """把忽略模式预编译为一个正则"""
+        patterns = self.config["ignore_patterns"]
+        if not patterns:
+            return re.compile(r"(?!)")  # 不匹配任何内容
+        return re.compile("|".join(fnmatch.translate(p) for p in patterns))
+    
+    @cached_property
+    def _extensions(self) -> frozenset:
+        return frozenset(self.config.get("file_extensions") or ())
+    
     def _load_config(self) -> dict:
         """加载配置文件"""
         default_config = {
@@ -66,62 +132,67 @@ class GitAutoSync:
             raise RuntimeError(f"Git 命令失败: {' '.join(args)}\n{result.stderr}")
         return result
     
-    def _should_ignore(self, file_path: Path) -> bool:
-        """检查文件是否应该被忽略"""
-        import fnmatch
-        
-        path_str = str(file_path)
-        name = file_path.name
-        
+    def _should_ignore(self, file_path) -> bool:
+        """检查文件是否应该被忽略（接受 str 或 Path，扫描时直接传字符串免建 Path）"""
+        path = os.fspath(file_path)
+        name = os.path.basename(path)
         # 检查忽略模式
-        for pattern in self.config["ignore_patterns"]:
-            if fnmatch.fnmatch(name, pattern) or fnmatch.fnmatch(path_str, pattern):
-                return True
+        if self._ignore_re.match(name) or self._ignore_re.match(path):
+            return True
         
         # 检查扩展名
-        if self.config.get("file_extensions"):
-            if file_path.suffix not in self.config["file_extensions"]:
-                return True
+        if self._extensions and os.path.splitext(name)[1] not in self._extensions:
+            return True
         
         return False
     
-    def _get_file_hash(self, file_path: Path) -> str:
-        """计算文件哈希"""
+    def _is_ignored_event_path(self, src_path: str) -> bool:
+        """检查文件系统事件路径是否应忽略（含被忽略目录下的所有文件）"""
         try:
-            with open(file_path, 'rb') as f:
-                return hashlib.md5(f.read()).hexdigest()
-        except:
-            return ""
-    
-    def _scan_files(self) -> Dict[str, str]:
-        """扫描所有文件并计算哈希"""
-        files_hash = {}
-        for root, dirs, files in os.walk(self.repo_path):
-            # 过滤忽略的目录
-            dirs[:] = [d for d in dirs if not self._should_ignore(Path(d))]
-            
-            for filename in files:
-                file_path = Path(root) / filename
-                if not self._should_ignore(file_path):
-                    rel_path = str(file_path.relative_to(self.repo_path))
-                    files_hash[rel_path] = self._get_file_hash(file_path)
+            rel_path = Path(src_path).relative_to(self.repo_path)
+        except ValueError:
+            return True
         
-        return files_hash
+        # 任一上级目录命中忽略模式（如 .git、output）则忽略
+        for part in rel_path.parts[:-1]:
+            if self._ignore_re.match(part):
+                return True
+        
+        return self._should_ignore(rel_path)
     
     def _has_changes(self) -> bool:
         """检查是否有未提交的更改"""
-        result = self._run_git("status", "--porcelain", check=False)
-        return bool(result.stdout.strip())
+        if self.repo is not None:
+            return bool(self.repo.status(untracked_files="normal", ignored=False))
+        result = self._run_git("status", "--porcelain=v2", "-z", check=False)
+        return bool(result.stdout)
     
     def _get_changed_files(self) -> list:
         """获取变更的文件列表"""
-        result = self._run_git("status", "--porcelain", check=False)
+        if self.repo is not None:
+            status = self.repo.status(untracked_files="normal", ignored=False)
+            return [f"{_porcelain_code(flags)}:{path}" for path, flags in sorted(status.items())]
+        
+        # porcelain v2 + NUL 分隔：路径含空格/引号也无需转义解析
+        result = self._run_git("status", "--porcelain=v2", "-z", check=False)
+        records = iter(result.stdout.split('\0'))
         files = []
-        for line in result.stdout.strip().split('\n'):
-            if line:
-                status = line[:2]
-                filename = line[3:]
-                files.append(f"{status}:{filename}")
+        for record in records:
+            if not record:
+                continue
+            kind = record[0]
+            if kind == "1":  # 普通修改：1 XY sub mH mI mW hH hI path
+                fields = record.split(" ", 8)
+                files.append(f"{fields[1].replace('.', ' ')}:{fields[8]}")
+            elif kind == "2":  # 重命名/复制：多一个分数字段，原路径是下一条记录
+                fields = record.split(" ", 9)
+                files.append(f"{fields[1].replace('.', ' ')}:{fields[9]}")
+                next(records, None)
+            elif kind == "u":  # 冲突：u XY sub m1 m2 m3 mW h1 h2 h3 path
+                fields = record.split(" ", 10)
+                files.append(f"{fields[1]}:{fields[10]}")
+            elif kind == "?":
+                files.append(f"??:{record[2:]}")
         return files
     
     def commit(self, message: Optional[str] = None) -> bool:
@@ -179,6 +250,11 @@ class GitAutoSync:
             print("📝 添加远程仓库...")
             self._run_git("remote", "add", "origin", remote_url)
         
+        # 让 git 自己加速状态查询：缓存未跟踪目录；macOS/Windows 上启用内置 fsmonitor
+        self._run_git("config", "core.untrackedCache", "true", check=False)
+        if sys.platform in ("darwin", "win32"):
+            self._run_git("config", "core.fsmonitor", "true", check=False)
+        
         # 保存配置
         self.config["github_username"] = username
         self.config["github_repo"] = repo_name
@@ -194,33 +270,15 @@ class GitAutoSync:
         print(f"   自动提交: {'✅' if self.config['auto_commit'] else '❌'}")
         print(f"   自动推送: {'✅' if self.config['auto_push'] else '❌'}")
         print(f"   防抖时间: {self.config['debounce_seconds']}秒")
+        print(f"   监听方式: {'文件系统事件' if HAS_WATCHDOG else '轮询 (pip install watchdog 可改为事件监听)'}")
         print("   按 Ctrl+C 停止\n")
         
-        last_check = time.time()
-        pending_changes = False
-        
         try:
-            while True:
-                time.sleep(1)
-                
-                # 检查是否有更改
-                if self._has_changes():
-                    if not pending_changes:
-                        pending_changes = True
-                        last_check = time.time()
-                        print(f"📝 检测到文件变化，等待 {self.config['debounce_seconds']} 秒后提交...")
-                    
-                    # 防抖：等待指定时间无新更改后再提交
-                    elapsed = time.time() - last_check
-                    if elapsed >= self.config["debounce_seconds"]:
-                        if self.config["auto_commit"]:
-                            changed = self._get_changed_files()
-                            self.commit()
-                            print(f"   变更文件: {', '.join(changed[:3])}{'...' if len(changed) > 3 else ''}\n")
-                        pending_changes = False
-                else:
-                    pending_changes = False
-                    
+            if HAS_WATCHDOG:
+                self._watch_events()
+            else:
+                self._watch_polling()
+        
         except KeyboardInterrupt:
             print("\n👋 停止监控")
             # 停止前如果有待提交更改，询问是否提交
@@ -230,54 +288,147 @@ class GitAutoSync:
                     self.commit()
                     if input("是否推送到远程? [y/N]: ").strip().lower() in ('y', 'yes'):
                         self.push()
+    
+    def _commit_pending(self):
+        """防抖结束后提交"""
+        if not self.config["auto_commit"]:
+            return
+        # 变更列表为空即无更改，省去单独的 _has_changes 调用
+        changed = self._get_changed_files()
+        if changed:
+            self.commit()
+            print(f"   变更文件: {', '.join(changed[:3])}{'...' if len(changed) > 3 else ''}\n")
+        else:
+            print("   内容未变化，跳过\n")
+    
+    def _watch_events(self):
+        """通过文件系统事件监控：只在文件真正变化时唤醒"""
+        from watchdog.observers import Observer
+        from watchdog.events import FileSystemEventHandler
+        
+        events: "queue.Queue[str]" = queue.Queue()
+        sync = self
+        
+        class ChangeHandler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                # 只关心内容变化；git 自身读取文件产生的 opened/closed_no_write 不算
+                if event.is_directory or event.event_type not in ("created", "modified", "moved", "deleted"):
+                    return
+                for path in (event.src_path, getattr(event, "dest_path", "")):
+                    if path and not sync._is_ignored_event_path(path):
+                        events.put(path)
+                        return
+        
+        observer = Observer()
+        observer.schedule(ChangeHandler(), str(self.repo_path), recursive=True)
+        observer.start()
+        try:
+            while True:
+                events.get()  # 阻塞直到第一个变化
+                print(f"📝 检测到文件变化，等待 {self.config['debounce_seconds']} 秒后提交...")
+                
+                # 防抖：直到 debounce_seconds 内没有新事件
+                while True:
+                    try:
+                        events.get(timeout=self.config["debounce_seconds"])
+                    except queue.Empty:
+                        break
+                
+                # 是否真有内容变化交给 git status 判断（只改了修改时间不算）
+                self._commit_pending()
+        finally:
+            observer.stop()
+            observer.join()
+    
+    def _watch_polling(self):
+        """轮询监控：空闲时逐步拉长间隔，有变化后只在防抖到期时醒来"""
+        debounce = self.config["debounce_seconds"]
+        interval = POLL_MIN_INTERVAL
+        last_snapshot: Optional[frozenset] = None
+        last_change = 0.0
+        pending = False
+        
+        while True:
+            time.sleep(interval)
+            snapshot = frozenset(self._get_changed_files())
+            
+            if not snapshot:
+                # 空闲：退避，减少无意义的唤醒
+                last_snapshot, pending = None, False
+                interval = min(interval * 2, POLL_MAX_INTERVAL)
+                continue
+            
+            now = time.monotonic()
+            if snapshot != last_snapshot:
+                if not pending:
+                    print(f"📝 检测到文件变化，等待 {debounce} 秒后提交...")
+                last_snapshot, last_change, pending = snapshot, now, True
+            
+            if not pending:
+                # 已处理过这批变化（如关闭了自动提交），等待新的变化
+                interval = POLL_MAX_INTERVAL
+                continue
+            
+            # 防抖：变更列表在 debounce_seconds 内保持不变才提交
+            remaining = debounce - (now - last_change)
+            if remaining > 0:
+                interval = remaining  # 直接睡到防抖到期
+                continue
+            
+            self._commit_pending()
+            pending = False
+            interval = POLL_MIN_INTERVAL
+            if self.config["auto_commit"]:
+                # 已提交：之后同一批文件再被修改也要重新开始防抖
+                last_snapshot = None
 
 
 def main():
-    if len(sys.argv) < 2:
-        # 默认启动监控
-        sync = GitAutoSync()
-        sync.watch()
-        
-    elif sys.argv[1] == "--setup":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--setup", action="store_true", help="配置 GitHub 远程仓库")
+    group.add_argument("--once", action="store_true", help="手动同步一次")
+    group.add_argument("--push", action="store_true", help="立即 push")
+    group.add_argument("--config", action="store_true", help="修改配置")
+    args = parser.parse_args()
+    
+    sync = GitAutoSync()
+    
+    if args.setup:
         # 配置远程仓库
         username = input("GitHub 用户名: ").strip()
         repo_name = input("仓库名称 (默认: emoji-template-generator): ").strip() or "emoji-template-generator"
-        
-        sync = GitAutoSync()
         sync.setup_remote(username, repo_name)
         
-    elif sys.argv[1] == "--once":
+    elif args.once:
         # 手动同步一次
-        sync = GitAutoSync()
         if sync.commit():
             print("✅ 同步完成")
         else:
             print("ℹ️  没有需要提交的更改")
             
-    elif sys.argv[1] == "--push":
-        # 立即推送
-        sync = GitAutoSync()
+    elif args.push:
+        # 立即推送（只调用 git，不加载配置）
         sync.push()
         
-    elif sys.argv[1] == "--config":
+    elif args.config:
         # 编辑配置
-        config_file = Path(".git-auto-sync.json")
-        if config_file.exists():
-            with open(config_file, 'r', encoding='utf-8') as f:
-                config = json.load(f)
+        if sync.config_file.exists():
             print("当前配置:")
-            print(json.dumps(config, indent=2, ensure_ascii=False))
+            print(json.dumps(sync.config, indent=2, ensure_ascii=False))
         
         print("\n修改配置:")
         auto_push = input("是否开启自动推送? [y/N]: ").strip().lower() == 'y'
         
-        sync = GitAutoSync()
         sync.config["auto_push"] = auto_push
         sync._save_config()
         print(f"✅ 配置已保存: auto_push={auto_push}")
         
     else:
-        print(__doc__)
+        # 默认启动监控
+        sync.watch()
 
 
 if __name__ == "__main__":
@@ -17,21 +17,113 @@ import sys
 import time
 import json
 import argparse
+import threading
+from collections import deque
 from pathlib import Path
 from urllib.parse import urljoin
 
 # Selenium 导入
 from selenium import webdriver
-from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.chrome.service import Service
-from selenium.common.exceptions import TimeoutException, NoSuchElementException
 from webdriver_manager.chrome import ChromeDriverManager
 
+# 文件系统监听（可选，未安装时按固定时间等待下载）
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+    HAS_WATCHDOG = True
+except ImportError:
+    HAS_WATCHDOG = False
+
+# Chrome 下载中的临时文件后缀
+PARTIAL_SUFFIXES = ('.crdownload', '.tmp', '.part')
+
+
+# 在页面内查找扩展注入的下载按钮并点击，一次 execute_async_script 完成
+# 参数: arguments[0] = 最长等待毫秒数；优先按钮（2x / iPhone）出现即点击，超时后退而求其次
+FIND_AND_CLICK_JS = r"""
+const timeoutMs = arguments[0];
+const done = arguments[arguments.length - 1];
+const KEYWORDS = /iPhone|Android|PC/;
+const FALLBACK = ['download', '下載', '下载', 'iphone', 'android'];
+
+// 与 XPath 的 contains(text(), ...) 一致：只看元素自身的文本节点
+function ownText(el) {
+    let text = '';
+    for (const node of el.childNodes) {
+        if (node.nodeType === Node.TEXT_NODE) text += node.nodeValue;
+    }
+    return text;
+}
+
+function candidates() {
+    const found = [];
+    // 方法1: 文字包含 iPhone / Android / PC 的按钮、链接、div
+    for (const el of document.querySelectorAll('button, a, div')) {
+        if (KEYWORDS.test(ownText(el))) found.push(el);
+    }
+    // 方法2: 扩展可能使用的特定类名
+    found.push(...document.querySelectorAll('.lsp-download-btn, .line-sticker-packer, [data-lsp], .mdCMN38Body button'));
+    // 方法3: 所有按钮按文字筛选
+    if (!found.length) {
+        for (const btn of document.querySelectorAll('button')) {
+            const text = btn.innerText.toLowerCase();
+            if (FALLBACK.some(k => text.includes(k))) found.push(btn);
+        }
+    }
+    return found;
+}
+
+function preferred(list) {
+    return list.find(el => el.innerText.includes('2x') || el.innerText.includes('iPhone'));
+}
+
+let finished = false;
+let scheduled = false;
+
+function finish() {
+    if (finished) return;
+    finished = true;
+    observer.disconnect();
+    clearTimeout(timer);
+    
+    const list = candidates();
+    const best = preferred(list);
+    const target = best || list[0];
+    if (!target) {
+        done({found: false, count: 0});
+        return;
+    }
+    target.scrollIntoView({block: 'center'});
+    target.click();
+    done({found: true, count: list.length, preferred: !!best, label: target.innerText.trim()});
+}
+
+// DOM 变化时每帧最多检查一次
+const observer = new MutationObserver(() => {
+    if (scheduled) return;
+    scheduled = true;
+    requestAnimationFrame(() => {
+        scheduled = false;
+        if (preferred(candidates())) finish();
+    });
+});
+const timer = setTimeout(finish, timeoutMs);
+
+if (preferred(candidates())) {
+    finish();
+} else {
+    observer.observe(document.documentElement, {childList: true, subtree: true});
+}
+"""
+
 
 class LineStickerAutoDownloader:
+    # 作者页中的贴图链接（下载按钮的选择器都在 FIND_AND_CLICK_JS 中，只构建一次）
+    PRODUCT_LINK_SELECTOR = "a[href*='/stickershop/product/']"
+    
     def __init__(self, output_dir="./downloads"):
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(exist_ok=True)
@@ -43,6 +135,12 @@ class LineStickerAutoDownloader:
         self.driver = None
         self.wait = None
         
+        # 下载完成通知（watchdog 监听下载目录）
+        self.observer = None
+        self.download_done = threading.Event()
+        self.downloads_completed = 0
+        self.last_download = None
+        
     def setup_driver(self, headless=False):
         """初始化 Chrome 浏览器"""
         chrome_options = Options()
@@ -102,8 +200,38 @@ class LineStickerAutoDownloader:
         self.driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
         
         self.wait = WebDriverWait(self.driver, 10)
+        self.driver.set_script_timeout(30)  # FIND_AND_CLICK_JS 最长等待 ext_wait 秒
         print("✅ Chrome 启动成功")
         
+        self._start_download_watch()
+    
+    def _start_download_watch(self):
+        """监听下载目录：出现完整文件（非 .crdownload）即视为下载完成"""
+        if not HAS_WATCHDOG:
+            return
+        
+        downloader = self
+        
+        class DownloadHandler(FileSystemEventHandler):
+            def on_created(self, event):
+                self._check(event.src_path, event.is_directory)
+            
+            def on_moved(self, event):
+                # Chrome 下载完成时把 .crdownload 重命名为最终文件名
+                self._check(event.dest_path, event.is_directory)
+            
+            def _check(self, path, is_directory):
+                name = os.path.basename(path)
+                if is_directory or name.startswith(('.', 'debug_')) or name.endswith(PARTIAL_SUFFIXES):
+                    return
+                downloader.last_download = name
+                downloader.downloads_completed += 1
+                downloader.download_done.set()
+        
+        self.observer = Observer()
+        self.observer.schedule(DownloadHandler(), str(self.output_dir))
+        self.observer.start()
+        
     def get_author_stickers(self, author_id):
         """获取作者所有贴图 ID"""
         url = f"https://store.line.me/stickershop/author/{author_id}/zh-Hant"
@@ -115,10 +243,12 @@ class LineStickerAutoDownloader:
         # 提取所有贴图链接
         sticker_links = []
         try:
-            # 寻找贴图链接
-            links = self.driver.find_elements(By.CSS_SELECTOR, "a[href*='/stickershop/product/']")
-            for link in links:
-                href = link.get_attribute("href")
+            # 寻找贴图链接：一次脚本调用取回所有 href，而不是每个链接一次 get_attribute
+            hrefs = self.driver.execute_script(
+                "return Array.from(document.querySelectorAll(arguments[0]), a => a.href);",
+                self.PRODUCT_LINK_SELECTOR
+            )
+            for href in hrefs:
                 if "/product/" in href:
                     sticker_id = href.split("/product/")[-1].split("/")[0]
                     if sticker_id.isdigit():
@@ -133,108 +263,148 @@ class LineStickerAutoDownloader:
         
         return sticker_links
     
-    def download_sticker(self, sticker_id, wait_time=5):
+    @staticmethod
+    def sticker_url(sticker_id):
+        """贴图商品页地址"""
+        return f"https://store.line.me/stickershop/product/{sticker_id}/zh-Hant"
+    
+    def _click_download_button(self, sticker_id, ext_wait):
+        """在当前页面点击扩展注入的下载按钮，未找到时保存调试截图"""
+        # 在页面内一次完成：等待扩展注入按钮 → 查找 → 选择 → 滚动 → 点击
+        # （原先每个 find_elements/.text/click 都是一次 WebDriver 往返）
+        print("   ⏳ 等待扩展加载...")
+        result = self.driver.execute_async_script(FIND_AND_CLICK_JS, int(ext_wait * 1000))
+        
+        if not result["found"]:
+            print("   ⚠️ 未找到下载按钮，扩展可能未加载或需要手动点击")
+            # 截图保存供调试
+            screenshot_path = self.output_dir / f"debug_{sticker_id}.png"
+            self.driver.save_screenshot(str(screenshot_path))
+            print(f"   📸 已保存调试截图: {screenshot_path}")
+            return False
+        
+        print(f"   ✅ 找到 {result['count']} 个可能的下载按钮")
+        if result["preferred"]:
+            print(f"   🎯 选择: {result['label']}")
+        else:
+            print(f"   🎯 选择第一个按钮")
+        print("   ✅ 已点击下载按钮")
+        return True
+    
+    def download_sticker(self, sticker_id, wait_time=5, ext_wait=4):
         """
         下载单个贴图
-        通过找到扩展注入的下载按钮并点击
+        通过找到扩展注入的下载按钮并点击（ext_wait: 最长等待扩展注入按钮的秒数）
         """
-        url = f"https://store.line.me/stickershop/product/{sticker_id}/zh-Hant"
+        url = self.sticker_url(sticker_id)
         print(f"\n📦 处理贴图 ID: {sticker_id}")
         print(f"   URL: {url}")
         
         try:
+            # driver.get 在页面 load 事件后返回，无需额外等待
             self.driver.get(url)
-            time.sleep(2)  # 等待页面加载
-            
-            # 等待扩展加载（通过查找扩展注入的按钮）
-            # 扩展通常会在页面顶部或贴图信息区域插入下载按钮
-            print("   ⏳ 等待扩展加载...")
-            time.sleep(2)
-            
-            # 方法1: 尝试通过 CSS 选择器查找扩展按钮
-            # 扩展按钮通常有特定的类名或包含特定文字
-            download_buttons = []
-            
-            # 查找包含 "iPhone 2x" 或 "Android" 等文字的按钮
-            try:
-                buttons = self.driver.find_elements(By.XPATH, 
-                    "//button[contains(text(), 'iPhone') or contains(text(), 'Android') or contains(text(), 'PC')] | " +
-                    "//a[contains(text(), 'iPhone') or contains(text(), 'Android') or contains(text(), 'PC')] | " +
-                    "//div[contains(text(), 'iPhone') or contains(text(), 'Android') or contains(text(), 'PC')]"
-                )
-                download_buttons.extend(buttons)
-            except:
-                pass
-            
-            # 方法2: 查找扩展可能使用的特定类名
-            try:
-                buttons = self.driver.find_elements(By.CSS_SELECTOR, 
-                    ".lsp-download-btn, .line-sticker-packer, [data-lsp], .mdCMN38Body button"
-                )
-                download_buttons.extend(buttons)
-            except:
-                pass
-            
-            # 方法3: 查找所有按钮并筛选
-            if not download_buttons:
-                all_buttons = self.driver.find_elements(By.TAG_NAME, "button")
-                for btn in all_buttons:
-                    try:
-                        text = btn.text.lower()
-                        if any(keyword in text for keyword in ['download', '下載', '下载', 'iphone', 'android']):
-                            download_buttons.append(btn)
-                    except:
-                        pass
             
-            if not download_buttons:
-                print("   ⚠️ 未找到下载按钮，扩展可能未加载或需要手动点击")
-                # 截图保存供调试
-                screenshot_path = self.output_dir / f"debug_{sticker_id}.png"
-                self.driver.save_screenshot(str(screenshot_path))
-                print(f"   📸 已保存调试截图: {screenshot_path}")
+            self.download_done.clear()
+            if not self._click_download_button(sticker_id, ext_wait):
                 return False
             
-            print(f"   ✅ 找到 {len(download_buttons)} 个可能的下载按钮")
-            
-            # 点击第一个 iPhone 2x 或 Android 按钮（通常是高清版本）
-            target_button = None
-            for btn in download_buttons:
-                try:
-                    text = btn.text
-                    if '2x' in text or 'iPhone' in text:
-                        target_button = btn
-                        print(f"   🎯 选择: {text}")
-                        break
-                except:
-                    continue
-            
-            if not target_button and download_buttons:
-                target_button = download_buttons[0]
-                print(f"   🎯 选择第一个按钮")
-            
-            if target_button:
-                # 滚动到按钮位置
-                self.driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", target_button)
-                time.sleep(0.5)
-                
-                # 点击按钮
-                target_button.click()
-                print("   ✅ 已点击下载按钮")
-                
-                # 等待下载完成
+            # 等待下载完成：有文件监听时文件落盘即返回，否则固定等待
+            if self.observer:
+                print(f"   ⏳ 等待下载完成 (最多{wait_time}秒)...")
+                if self.download_done.wait(wait_time):
+                    print(f"   📥 已下载: {self.last_download}")
+                else:
+                    print("   ⚠️ 等待超时，下载可能仍在进行")
+            else:
                 print(f"   ⏳ 等待下载完成 ({wait_time}秒)...")
                 time.sleep(wait_time)
-                
-                return True
+            
+            return True
             
         except Exception as e:
             print(f"   ❌ 错误: {e}")
             return False
+    
+    def _download_in_tabs(self, sticker_ids, tabs, wait_time=5, ext_wait=4):
+        """
+        多标签页流水线下载：处理一个标签页时，其余标签页已在后台加载下一个贴图页面
+        WebDriver 同一时刻只能操作一个标签页，重叠的是页面加载和下载时间
+        返回 (成功数, 失败数)
+        """
+        pending = deque(sticker_ids)
+        total = len(sticker_ids)
+        downloads_before = self.downloads_completed
+        handles = [self.driver.current_window_handle]
+        for _ in range(tabs - 1):
+            self.driver.switch_to.new_window('tab')
+            handles.append(self.driver.current_window_handle)
+        
+        loading = {}  # 标签页 -> 正在加载的贴图 ID
+        
+        def start_next(handle):
+            """在标签页中开始加载下一个贴图（不等待加载完成）"""
+            if pending:
+                sticker_id = pending.popleft()
+                self.driver.switch_to.window(handle)
+                self.driver.execute_script("window.location.href = arguments[0];", self.sticker_url(sticker_id))
+                loading[handle] = sticker_id
+        
+        for handle in handles:
+            start_next(handle)
         
-        return False
+        success_count = 0
+        failed_count = 0
+        done_count = 0
+        while loading:
+            for handle in handles:
+                if handle not in loading:
+                    continue
+                sticker_id = loading.pop(handle)
+                done_count += 1
+                print(f"[{done_count}/{total}] ", end="")
+                print(f"\n📦 处理贴图 ID: {sticker_id} (标签页 {handles.index(handle) + 1})")
+                
+                try:
+                    self.driver.switch_to.window(handle)
+                    # 等到该标签页已导航到目标页面并加载完成
+                    WebDriverWait(self.driver, 30).until(
+                        lambda d: f"/product/{sticker_id}/" in d.current_url
+                        and d.execute_script("return document.readyState") == "complete"
+                    )
+                    if self._click_download_button(sticker_id, ext_wait):
+                        success_count += 1
+                    else:
+                        failed_count += 1
+                except Exception as e:
+                    print(f"   ❌ 错误: {e}")
+                    failed_count += 1
+                
+                # 下载在浏览器后台进行，标签页立即开始加载下一个
+                start_next(handle)
+        
+        # 等待最后一批下载落盘
+        if self.observer:
+            deadline = time.time() + wait_time
+            while True:
+                # 先 clear 再检查计数：检查之后完成的下载一定会重新 set，不会丢失唤醒
+                self.download_done.clear()
+                remaining = deadline - time.time()
+                if self.downloads_completed - downloads_before >= success_count or remaining <= 0:
+                    break
+                self.download_done.wait(remaining)
+        else:
+            time.sleep(wait_time)
+        
+        # 只保留第一个标签页
+        for handle in handles[1:]:
+            self.driver.switch_to.window(handle)
+            self.driver.close()
+        self.driver.switch_to.window(handles[0])
+        
+        return success_count, failed_count
     
-    def batch_download(self, author_id, limit=None, delay=3):
-        """批量下载作者的所有贴图"""
+    def batch_download(self, author_id, limit=None, delay=3, tabs=1):
+        """批量下载作者的所有贴图（tabs > 1 时多标签页并行）"""
         print(f"\n{'='*60}")
         print(f"🎨 LINE 贴图批量下载")
         print(f"作者 ID: {author_id}")
@@ -256,17 +426,21 @@ class LineStickerAutoDownloader:
         
         print(f"\n准备下载 {total} 个贴图\n")
         
-        for i, sticker_id in enumerate(sticker_ids, 1):
-            print(f"[{i}/{total}] ", end="")
-            
-            if self.download_sticker(sticker_id):
-                success_count += 1
-            else:
-                failed_count += 1
-            
-            if i < total:  # 不是最后一个
-                print(f"   ⏳ 等待 {delay} 秒...")
-                time.sleep(delay)
+        if tabs > 1:
+            success_count, failed_count = self._download_in_tabs(sticker_ids, tabs)
+        else:
+            for i, sticker_id in enumerate(sticker_ids, 1):
+                print(f"[{i}/{total}] ", end="")
+                
+                if self.download_sticker(sticker_id):
+                    success_count += 1
+                else:
+                    failed_count += 1
+                
+                # 不是最后一个；上一个下载已确认完成时无需再等
+                if i < total and not self.download_done.is_set():
+                    print(f"   ⏳ 等待 {delay} 秒...")
+                    time.sleep(delay)
         
         print(f"\n{'='*60}")
         print(f"✅ 完成!")
@@ -276,6 +450,11 @@ class LineStickerAutoDownloader:
     
     def close(self):
         """关闭浏览器"""
+        if self.observer:
+            self.observer.stop()
+            self.observer.join()
+            self.observer = None
+        
         if self.driver:
             print("🚪 关闭 Chrome...")
             self.driver.quit()
@@ -291,6 +470,8 @@ def main():
                         help='限制下载数量')
     parser.add_argument('-d', '--delay', type=int, default=3,
                         help='下载间隔秒数 (默认: 3)')
+    parser.add_argument('-t', '--tabs', type=int, default=1,
+                        help='并行标签页数，>1 时多个贴图页面交替加载下载 (默认: 1)')
     parser.add_argument('--headless', action='store_true',
                         help='无头模式（不显示浏览器窗口）')
     parser.add_argument('--id', type=int, default=None,
@@ -309,7 +490,7 @@ def main():
             downloader.download_sticker(args.id, wait_time=10)
         else:
             # 批量下载
-            downloader.batch_download(args.author_id, args.limit, args.delay)
+            downloader.batch_download(args.author_id, args.limit, args.delay, args.tabs)
             
     except KeyboardInterrupt:
         print("\n⚠️ 用户中断")
@@ -9,10 +9,20 @@ import sys
 from pathlib import Path
 import json
 
+# 向导里统计的图片扩展名（不带点，小写）
+_IMG_EXTS = frozenset({'png', 'jpg', 'jpeg', 'gif', 'webp'})
+
 def log(message, level="INFO"):
     icons = {"INFO": "ℹ️", "SUCCESS": "✅", "WARNING": "⚠️", "ERROR": "❌"}
     print(f"{icons.get(level, 'ℹ️')} {message}")
 
+def count_images(folder):
+    """单次 scandir 统计文件夹内图片数量"""
+    with os.scandir(folder) as it:
+        return sum(1 for e in it
+                   if e.is_file()
+                   and e.name.rpartition('.')[2].lower() in _IMG_EXTS)
+
 def main():
     print("\n" + "=" * 50)
     print("🎨 表情包批量处理器 - 快速配置")
@@ -47,15 +57,15 @@ def main():
                 continue
         
         # 检查子文件夹
-        subdirs = [d for d in path.iterdir() if d.is_dir() and not d.name.startswith('.')]
+        with os.scandir(path) as it:
+            subdirs = [e for e in it if e.is_dir() and not e.name.startswith('.')]
         log(f"找到 {len(subdirs)} 个子文件夹")
         
         if subdirs:
             print("\n子文件夹列表:")
             for i, d in enumerate(subdirs[:10], 1):
                 # 统计图片
-                imgs = list(d.glob("*.png")) + list(d.glob("*.jpg")) + list(d.glob("*.gif"))
-                print(f"  {i}. {d.name} ({len(imgs)} 张图片)")
+                print(f"  {i}. {d.name} ({count_images(d.path)} 张图片)")
             if len(subdirs) > 10:
                 print(f"  ... 还有 {len(subdirs) - 10} 个")
         
@@ -86,6 +96,8 @@ def main():
         },
         "font_path": "刘欢卡通手书.ttf",
         "image_quality": 95,
+        "jpeg_subsampling": 2,
+        "workers": None,
         "canvas_size": [1200, 1600],
         "auto_start": False
     }
@@ -5,15 +5,128 @@
 """
 
 import os
+import re
+import itertools
+import time
+import socket
 import json
-import base64
+import binascii
 import zipfile
+import email.utils
+from collections import OrderedDict
 from pathlib import Path
-from http.server import HTTPServer, SimpleHTTPRequestHandler
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
 from urllib.parse import parse_qs, urlparse
+import queue
 import threading
 import shutil
 
+# 流式 JSON 解析（可选，上传时边读边解码图片；未安装时整体 json.loads）
+# 只用于旧接口 /api/upload，仓库内页面已改用 /api/submit_zip，仅外部客户端会走到
+try:
+    import ijson
+    HAS_IJSON = True
+except ImportError:
+    HAS_IJSON = False
+
+# 浏览器可显示的图片格式及其 Content-Type；文件名含 _key / _s 的是封面、缩略图，不参与渲染
+_CONTENT_TYPES = {
+    '.png': 'image/png',
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.gif': 'image/gif',
+    '.webp': 'image/webp'
+}
+_ALLOWED_EXTS = frozenset(_CONTENT_TYPES)
+_EXCLUDE_RE = re.compile(r'_(?:key|s)')
+
+# build_folder_info 结果缓存：键为 (文件夹路径, 目录 mtime_ns)，增删改名文件都会改变目录 mtime
+_FOLDER_INFO_CACHE_SIZE = 8
+_folder_info_cache = OrderedDict()
+_folder_info_lock = threading.Lock()
+
+# 图片 id 表：URL 里只放整数 id，不再 base64 编码绝对路径（也不会暴露本机路径）
+# 切换集合文件夹时清空；id 用递增计数，清空后也不会复用旧 id
+_image_paths = {}     # id -> 路径
+_image_ids = {}       # 路径 -> id
+_image_id_counter = itertools.count()
+_image_id_lock = threading.Lock()
+
+
+def _register_image(path):
+    """为图片路径分配稳定的整数 id"""
+    with _image_id_lock:
+        image_id = _image_ids.get(path)
+        if image_id is None:
+            image_id = _image_ids[path] = next(_image_id_counter)
+            _image_paths[image_id] = path
+        return image_id
+
+
+def _reset_image_ids():
+    """清空图片 id 表，连同引用这些 id 的文件夹信息缓存"""
+    with _folder_info_lock:
+        _folder_info_cache.clear()
+    with _image_id_lock:
+        _image_paths.clear()
+        _image_ids.clear()
+
+# 上传图片的ZIP打包放到后台线程，请求写完图片即可返回（同样只服务旧接口 /api/upload）
+_zip_queue = queue.Queue()
+_zip_status = {}      # 文件夹名 -> "pending" / "done" / "error: ..."
+
+
+def _build_zip(folder_name, zip_path, entries):
+    """把 (文件名, 数据) 写入ZIP；先写临时文件，完成后原子替换"""
+    tmp_path = zip_path.with_name(zip_path.name + ".part")
+    date_time = time.localtime()[:6]
+    try:
+        # 图片本身已压缩，直接存储不再 DEFLATE
+        with zipfile.ZipFile(tmp_path, 'w', zipfile.ZIP_STORED) as zf:
+            for name, img_bytes in entries:
+                info = zipfile.ZipInfo(name, date_time=date_time)
+                info.compress_type = zipfile.ZIP_STORED
+                info.external_attr = 0o644 << 16
+                zf.writestr(info, img_bytes)
+        os.replace(tmp_path, zip_path)
+    except BaseException:
+        # 失败时不在输出目录留下半截的 .part 文件
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+
+def _zip_worker():
+    """后台打包线程：依次处理 handle_upload 提交的任务"""
+    while True:
+        job = _zip_queue.get()
+        folder_name = job["folder_name"]
+        try:
+            _build_zip(**job)
+            _zip_status[folder_name] = "done"
+            print(f"📦 ZIP已生成: {job['zip_path']}")
+        except Exception as e:
+            _zip_status[folder_name] = f"error: {e}"
+            print(f"ZIP error: {e}")
+        finally:
+            _zip_queue.task_done()
+
+
+class _BoundedReader:
+    """只读取 Content-Length 字节的请求体包装，避免流式解析读到连接上的下一个请求"""
+    
+    def __init__(self, raw, length):
+        self.raw = raw
+        self.remaining = length
+    
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.raw.read(size)
+        self.remaining -= len(data)
+        return data
+
 # 全局状态
 class ServerState:
     collection_folder = None  # 集合文件夹路径
@@ -21,12 +134,17 @@ class ServerState:
     all_folders = []         # 所有待处理文件夹列表
     current_index = 0        # 当前处理索引
     output_dir = None        # 输出目录
+    lock = threading.Lock()  # 多线程服务器下保护上面几项的成组更新
 
 state = ServerState()
 
 class APIHandler(SimpleHTTPRequestHandler):
     """处理API请求和静态文件"""
     
+    # 连接建立时设置 TCP_NODELAY：头部和 sendfile 正文分两次写出，
+    # 避免 Nagle 与延迟 ACK 叠加让小图片多等约 40ms
+    disable_nagle_algorithm = True
+    
     def end_headers(self):
         # 添加CORS头
         self.send_header('Access-Control-Allow-Origin', '*')
@@ -47,28 +165,46 @@ class APIHandler(SimpleHTTPRequestHandler):
         except:
             pass
     
+    def copyfile(self, source, outputfile):
+        """静态文件（页面、字体等）同样用 socket.sendfile 零拷贝发送"""
+        self.connection.sendfile(source)
+    
     def do_GET(self):
         parsed = urlparse(self.path)
         path = parsed.path
         
         # API: 获取当前文件夹信息
         if path == '/api/folder':
-            self.send_json(self.get_folder_info())
+            query = parse_qs(parsed.query)
+            try:
+                index = int(query['index'][0]) if 'index' in query else None
+            except ValueError:
+                self.send_json({"error": "Invalid folder index"}, status=400)
+                return
+            info = self.get_folder_info(index)
+            self.send_json(info, status=400 if "error" in info else 200)
             return
         
         # API: 获取文件夹列表
         if path == '/api/folders':
+            with state.lock:
+                folders, current_index = state.all_folders, state.current_index
             self.send_json({
-                "folders": state.all_folders,
-                "current_index": state.current_index,
-                "total": len(state.all_folders)
+                "folders": folders,
+                "current_index": current_index,
+                "total": len(folders)
             })
             return
         
+        # API: 查询后台ZIP打包状态（配合 /api/upload，供外部客户端使用）
+        if path == '/api/zip_status':
+            folder_name = parse_qs(parsed.query).get('folder', [''])[0]
+            self.send_json({"folder": folder_name, "status": _zip_status.get(folder_name, "unknown")})
+            return
+        
         # API: 获取图片文件（用于浏览器加载）
         if path.startswith('/api/image/'):
-            image_path = path[len('/api/image/'):]
-            self.serve_image(image_path)
+            self.serve_image(path[len('/api/image/'):])
             return
         
         # 静态文件服务
@@ -78,11 +214,16 @@ class APIHandler(SimpleHTTPRequestHandler):
         parsed = urlparse(self.path)
         path = parsed.path
         
-        # API: 接收生成的图片数据
+        # API: 接收生成的图片数据（旧接口，仓库内页面已改用 /api/submit_zip）
         if path == '/api/upload':
             self.handle_upload()
             return
         
+        # API: 接收浏览器端打包好的ZIP
+        if path == '/api/submit_zip':
+            self.handle_submit_zip(parse_qs(parsed.query))
+            return
+        
         # API: 标记当前文件夹完成
         if path == '/api/complete':
             self.handle_complete()
@@ -90,143 +231,294 @@ class APIHandler(SimpleHTTPRequestHandler):
         
         self.send_error(404)
     
-    def send_json(self, data):
+    def send_json(self, data, status=200):
         """发送JSON响应"""
-        self.send_response(200)
+        self.send_response(status)
         self.send_header('Content-Type', 'application/json')
         self.end_headers()
         self.wfile.write(json.dumps(data).encode())
     
-    def get_folder_info(self):
-        """获取当前文件夹信息"""
-        if not state.current_folder:
-            return {"error": "No folder selected"}
-        
-        folder_path = Path(state.current_folder)
-        
-        # 扫描图片文件
-        images = []
-        for f in folder_path.iterdir():
-            if f.is_file() and f.suffix.lower() in ['.png', '.jpg', '.jpeg', '.gif', '.webp']:
-                if '_key' not in f.name and '_s' not in f.name:
-                    images.append({
-                        "name": f.name,
-                        "path": str(f.absolute()),
-                        "url": f"/api/image/{base64.b64encode(str(f.absolute()).encode()).decode()}"
-                    })
-        
-        images.sort(key=lambda x: x["name"])
-        
-        # 解析标题
-        title = folder_path.name
-        subtitle = "表情包合集"
-        if '·' in title:
-            parts = title.split('·')
-            title = parts[0].strip()
-            subtitle = parts[1].strip()
+    def read_json_body(self):
+        """按 Content-Length 把请求体读入预分配的 bytearray 后直接解析 JSON"""
+        content_length = int(self.headers['Content-Length'])
+        buf = bytearray(content_length)
+        view = memoryview(buf)
+        received = 0
+        while received < content_length:
+            n = self.rfile.readinto(view[received:])
+            if not n:
+                raise ConnectionError("Incomplete request body")
+            received += n
+        view.release()
+        return json.loads(buf)
+    
+    def get_folder_info(self, index=None):
+        """获取文件夹信息（指定索引或当前文件夹）"""
+        with state.lock:
+            folders, current_folder = state.all_folders, state.current_folder
         
-        # 检测动态/静态
-        gif_count = sum(1 for img in images if img["name"].endswith('.gif'))
-        anim_type = "动态表情包" if gif_count > len(images) * 0.3 else "静态表情包"
+        if index is not None:
+            if not 0 <= index < len(folders):
+                return {"error": "Invalid folder index"}
+            folder_path = Path(folders[index]["path"])
+        elif not current_folder:
+            return {"error": "No folder selected"}
+        else:
+            folder_path = Path(current_folder)
         
-        return {
-            "name": folder_path.name,
-            "title": title,
-            "subtitle": subtitle,
-            "images": images,
-            "image_count": len(images),
-            "anim_type": anim_type,
-            "main_image": images[0] if images else None
-        }
+        return build_folder_info(folder_path)
     
-    def serve_image(self, encoded_path):
-        """提供图片文件"""
+    def serve_image(self, image_id):
+        """提供图片文件（只服务 build_folder_info 登记过的 id）"""
         try:
-            image_path = base64.b64decode(encoded_path).decode()
-            path = Path(image_path)
-            if path.exists():
+            image_path = _image_paths.get(int(image_id))
+            path = Path(image_path) if image_path else None
+            if path and path.is_file():
+                st = path.stat()
+                size = st.st_size
+                etag = f'"{st.st_mtime_ns:x}-{size:x}"'
+                if self.is_not_modified(etag, st.st_mtime):
+                    # 浏览器缓存仍有效：只回 304，不读文件也不发正文
+                    self.send_response(304)
+                    self.send_header('ETag', etag)
+                    self.end_headers()
+                    return
+                
                 self.send_response(200)
-                content_type = {
-                    '.png': 'image/png',
-                    '.jpg': 'image/jpeg',
-                    '.jpeg': 'image/jpeg',
-                    '.gif': 'image/gif',
-                    '.webp': 'image/webp'
-                }.get(path.suffix.lower(), 'application/octet-stream')
+                content_type = _CONTENT_TYPES.get(path.suffix.lower(), 'application/octet-stream')
                 self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(size))
+                self.send_header('ETag', etag)
+                self.send_header('Last-Modified', self.date_time_string(int(st.st_mtime)))
+                # 每次使用前向服务器确认，文件未变时走 304
+                self.send_header('Cache-Control', 'no-cache')
                 self.end_headers()
+                # 头部已由 end_headers 写出；正文用 socket.sendfile 在内核内零拷贝发送，
+                # 不支持 os.sendfile 的平台会自动退回分块 send
                 with open(path, 'rb') as f:
-                    self.wfile.write(f.read())
+                    self.connection.sendfile(f, 0, size)
                 return
         except Exception as e:
             print(f"Error serving image: {e}")
         
         self.send_error(404)
     
+    def is_not_modified(self, etag, mtime):
+        """根据 If-None-Match / If-Modified-Since 判断浏览器缓存是否仍然有效"""
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match is not None:
+            return if_none_match.strip() == '*' or etag in [t.strip() for t in if_none_match.split(',')]
+        
+        if_modified_since = self.headers.get('If-Modified-Since')
+        if if_modified_since:
+            try:
+                since = email.utils.parsedate_to_datetime(if_modified_since)
+            except (TypeError, ValueError):
+                return False
+            return since.tzinfo is not None and int(mtime) <= since.timestamp()
+        return False
+    
+    def upload_events(self):
+        """逐个产出上传请求中的 ("folder_name", 文件夹名, None) 与 ("image", 文件名, base64)
+        
+        装了 ijson 时边读边解析，一次只持有一张图片的 base64；否则整体解析后逐个产出。
+        产出时生成器自身不保留 base64 的引用，调用方用完即可回收
+        """
+        if not HAS_IJSON:
+            data = self.read_json_body()
+            yield ("folder_name", data.get('folder_name'), None)
+            for img_data in data.get('images', []):  # [{name, data: base64}]
+                # pop 掉原字符串，交出后即可回收
+                yield ("image", img_data['name'], img_data.pop('data'))
+            return
+        
+        reader = _BoundedReader(self.rfile, int(self.headers['Content-Length']))
+        item = {}
+        for prefix, event, value in ijson.parse(reader):
+            if prefix == 'folder_name' and event == 'string':
+                yield ("folder_name", value, None)
+            elif prefix == 'images.item.name':
+                item['name'] = value
+            elif prefix == 'images.item.data':
+                item['data'] = value
+            elif prefix == 'images.item' and event == 'end_map':
+                yield ("image", item.pop('name', None), item.pop('data', None))
+    
     def handle_upload(self):
         """处理上传的图片数据（Base64）"""
         try:
-            content_length = int(self.headers['Content-Length'])
-            post_data = self.rfile.read(content_length)
-            data = json.loads(post_data)
-            
-            folder_name = data.get('folder_name')
-            images = data.get('images', [])  # [{name, data: base64}]
-            
-            if not folder_name or not images:
-                self.send_json({"error": "Missing data"})
-                return
-            
-            # 保存到输出目录
-            folder_output = state.output_dir / folder_name
-            folder_output.mkdir(parents=True, exist_ok=True)
-            
+            folder_name = None
+            folder_output = None
+            pending = []      # folder_name 出现在 images 之后时，先暂存已解码的图片
             saved_files = []
-            for img_data in images:
-                name = img_data['name']
-                data = img_data['data'].split(',')[1] if ',' in img_data['data'] else img_data['data']
-                img_bytes = base64.b64decode(data)
-                
+            entries = []
+            
+            def save(name, img_bytes):
+                nonlocal folder_output
+                if folder_output is None:
+                    # 保存到输出目录
+                    folder_output = state.output_dir / folder_name
+                    folder_output.mkdir(parents=True, exist_ok=True)
                 output_path = folder_output / name
                 with open(output_path, 'wb') as f:
                     f.write(img_bytes)
                 saved_files.append(str(output_path))
+                # 解码后的数据直接交给打包线程，不必写盘后再读回
+                entries.append((output_path.name, img_bytes))
+            
+            for kind, name, data in self.upload_events():
+                if kind == "folder_name":
+                    folder_name = name
+                    continue
+                
+                # 去掉 data URI 前缀；a2b_base64 直接接受 ASCII 字符串，省去 b64decode 的中间 bytes
+                head, sep, payload = data.partition(',')
+                img_bytes = binascii.a2b_base64(payload if sep else head)
+                del data, head, payload
+                
+                pending.append((name, img_bytes))
+                if folder_name:
+                    for item in pending:
+                        save(*item)
+                    pending.clear()
+            
+            if folder_name:
+                for item in pending:
+                    save(*item)
             
-            # 创建ZIP包
+            if not folder_name or not entries:
+                self.send_json({"error": "Missing data"})
+                return
+            
+            # ZIP交给后台线程，进度通过 /api/zip_status 查询
             zip_path = state.output_dir / "_downloads" / f"{folder_name}_表情包.zip"
             zip_path.parent.mkdir(parents=True, exist_ok=True)
-            with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zf:
-                for file_path in saved_files:
-                    zf.write(file_path, Path(file_path).name)
+            _zip_status[folder_name] = "pending"
+            _zip_queue.put({"folder_name": folder_name, "zip_path": zip_path, "entries": entries})
             
             self.send_json({
                 "success": True,
                 "saved_files": saved_files,
-                "zip": str(zip_path)
+                "zip": str(zip_path),
+                "zip_pending": True
             })
             
         except Exception as e:
             print(f"Upload error: {e}")
             self.send_json({"error": str(e)})
     
-    def handle_complete(self):
-        """标记当前文件夹处理完成"""
+    def handle_submit_zip(self, query):
+        """将浏览器端生成的ZIP原样写入输出目录"""
         try:
+            folder_name = Path(query.get('folder', [''])[0]).name
+            if not folder_name:
+                self.send_json({"error": "Missing folder"})
+                return
+            
             content_length = int(self.headers['Content-Length'])
-            post_data = self.rfile.read(content_length)
-            data = json.loads(post_data)
+            zip_path = state.output_dir / f"{folder_name}_表情包.zip"
+            tmp_path = zip_path.with_name(zip_path.name + ".part")
             
-            print(f"✅ 文件夹完成: {state.current_folder.name if state.current_folder else 'unknown'}")
+            # 分块写入临时文件，完成后原子替换；失败时删除 .part
+            try:
+                with open(tmp_path, 'wb') as f:
+                    remaining = content_length
+                    while remaining > 0:
+                        chunk = self.rfile.read(min(remaining, 64 * 1024))
+                        if not chunk:
+                            raise ConnectionError("Incomplete upload")
+                        f.write(chunk)
+                        remaining -= len(chunk)
+                os.replace(tmp_path, zip_path)
+            except BaseException:
+                tmp_path.unlink(missing_ok=True)
+                raise
+            
+            self.send_json({"success": True, "zip": str(zip_path)})
+            
+        except Exception as e:
+            print(f"Submit error: {e}")
+            self.send_json({"error": str(e)})
+    
+    def handle_complete(self):
+        """标记文件夹处理完成"""
+        try:
+            data = self.read_json_body()
+            
+            print(f"✅ 文件夹完成: {data.get('folder_name') or 'unknown'}")
             
             self.send_json({"success": True})
         except Exception as e:
             self.send_json({"error": str(e)})
 
 
+def build_folder_info(folder_path):
+    """扫描文件夹并生成供浏览器渲染的信息"""
+    # all_folders 里的路径已经是绝对路径，abspath 只做字符串规整
+    folder = os.path.abspath(folder_path)
+    key = (folder, os.stat(folder).st_mtime_ns)
+    with _folder_info_lock:
+        cached = _folder_info_cache.get(key)
+        if cached is not None:
+            _folder_info_cache.move_to_end(key)
+            return cached
+    
+    info = _scan_folder_info(folder)
+    with _folder_info_lock:
+        _folder_info_cache[key] = info
+        while len(_folder_info_cache) > _FOLDER_INFO_CACHE_SIZE:
+            _folder_info_cache.popitem(last=False)
+    return info
+
+
+def _scan_folder_info(folder):
+    """扫描文件夹（build_folder_info 缓存未命中时调用，folder 为绝对路径字符串）"""
+    # 扫描图片文件（scandir 的 is_file 来自目录读取本身，只有符号链接才需 stat），
+    # 同时统计 GIF 数量用于判断动态/静态
+    images = []
+    gif_count = 0
+    with os.scandir(folder) as it:
+        for f in it:
+            name = f.name
+            ext = os.path.splitext(name)[1].lower()
+            if ext in _ALLOWED_EXTS and not _EXCLUDE_RE.search(name) and f.is_file():
+                images.append({
+                    "name": name,
+                    "path": f.path,
+                    "url": f"/api/image/{_register_image(f.path)}"
+                })
+                if name.endswith('.gif'):
+                    gif_count += 1
+    
+    images.sort(key=lambda x: x["name"])
+    
+    # 解析标题
+    folder_name = os.path.basename(folder)
+    title = folder_name
+    subtitle = "表情包合集"
+    head, sep, tail = title.partition('·')
+    if sep:
+        title, subtitle = head.strip(), tail.strip()
+    
+    # 检测动态/静态
+    anim_type = "动态表情包" if gif_count > len(images) * 0.3 else "静态表情包"
+    
+    return {
+        "name": folder_name,
+        "title": title,
+        "subtitle": subtitle,
+        "images": images,
+        "image_count": len(images),
+        "anim_type": anim_type,
+        "main_image": images[0] if images else None
+    }
+
+
 def start_server(port=8765, directory="/Users/cy/workspace/表情包模板"):
     """启动服务器"""
     os.chdir(directory)
-    server = HTTPServer(('localhost', port), APIHandler)
+    # 每个请求一个线程：慢上传不会阻塞浏览器的图片请求
+    server = ThreadingHTTPServer(('localhost', port), APIHandler)
     print(f"🚀 服务器启动: http://localhost:{port}")
     
     # 在后台线程运行
@@ -234,36 +526,59 @@ def start_server(port=8765, directory="/Users/cy/workspace/表情包模板"):
     thread.daemon = True
     thread.start()
     
+    # ZIP打包线程
+    threading.Thread(target=_zip_worker, daemon=True).start()
+    
     return server
 
 
+def wait_for_server(port=8765, timeout=5):
+    """探测端口直到服务器可以接受连接"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('localhost', port), timeout=0.1).close()
+            return True
+        except OSError:
+            time.sleep(0.02)
+    return False
+
+
 def set_collection_folder(folder_path):
     """设置要处理的集合文件夹"""
-    state.collection_folder = Path(folder_path)
-    state.output_dir = state.collection_folder.parent / (state.collection_folder.name + "_output")
-    state.output_dir.mkdir(parents=True, exist_ok=True)
+    # 存为绝对路径，之后子文件夹路径直接取 DirEntry.path
+    collection_folder = Path(folder_path).absolute()
+    output_dir = collection_folder.parent / (collection_folder.name + "_output")
+    output_dir.mkdir(parents=True, exist_ok=True)
     
-    # 扫描所有子文件夹
-    state.all_folders = []
-    for item in sorted(state.collection_folder.iterdir()):
-        if item.is_dir() and not item.name.startswith('.'):
-            state.all_folders.append({
-                "name": item.name,
-                "path": str(item.absolute())
-            })
+    # 扫描所有子文件夹：先过滤再排序，文件和隐藏目录不参与排序
+    with os.scandir(collection_folder) as it:
+        entries = [e for e in it if not e.name.startswith('.') and e.is_dir()]
+    entries.sort(key=lambda e: e.name)
+    all_folders = [{"name": e.name, "path": e.path} for e in entries]
+    
+    # 上一个集合的图片 id 不再需要，避免长时间批处理中 id 表无限增长
+    _reset_image_ids()
     
-    print(f"📁 找到 {len(state.all_folders)} 个待处理文件夹")
-    return state.all_folders
+    # 扫描完成后一次性替换，请求线程不会看到一半的状态
+    with state.lock:
+        state.collection_folder = collection_folder
+        state.output_dir = output_dir
+        state.all_folders = all_folders
+    
+    print(f"📁 找到 {len(all_folders)} 个待处理文件夹")
+    return all_folders
 
 
 def set_current_folder(index):
     """设置当前处理的文件夹"""
-    if 0 <= index < len(state.all_folders):
+    with state.lock:
+        if not 0 <= index < len(state.all_folders):
+            return False
         state.current_index = index
-        state.current_folder = Path(state.all_folders[index]["path"])
-        print(f"🎯 当前处理: {state.current_folder.name}")
-        return True
-    return False
+        state.current_folder = current_folder = Path(state.all_folders[index]["path"])
+    print(f"🎯 当前处理: {current_folder.name}")
+    return True
 
 
 if __name__ == "__main__":